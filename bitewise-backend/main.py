@@ -1,11 +1,17 @@
-from fastapi import FastAPI, File, UploadFile
+from fastapi import FastAPI, File, HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from ultralytics import YOLO
 from PIL import Image
+import numpy as np
 import io
 import random
-import uuid
 import os
+import hashlib
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pydantic import BaseModel
 import requests
 import os
@@ -66,7 +72,7 @@ def load_usda_cache_into_db(cache_dir="usda_cache"):
     try:
         files = os.listdir(cache_dir)
     except Exception:
-        return
+        files = []
 
     # map fdcId -> macros from detail files
     details = {}
@@ -114,6 +120,98 @@ def load_usda_cache_into_db(cache_dir="usda_cache"):
             except Exception:
                 continue
 
+    # enriched entries change which classes resolve locally
+    build_class_lookup()
+
+
+# --- Class -> nutrient lookup ---
+NUTRIENT_KEYS = ("calories", "protein", "carbs", "fat", "fiber")
+
+# Per-class tables indexed by model class ID, built from model.names + FOOD_DATABASE
+CLASS_LABELS: List[str] = []
+CLASS_NUTRIENTS = np.zeros((0, len(NUTRIENT_KEYS)))  # macros per row; NaN until resolved
+CLASS_SCALED = np.zeros(0, dtype=bool)  # True -> per 100g (local DB), False -> already scaled
+CLASS_IS_FOOD = np.zeros(0, dtype=bool)
+
+
+def build_class_lookup():
+    """Precompute nutrient rows for every model class so inference can index them by class ID."""
+    global CLASS_LABELS, CLASS_NUTRIENTS, CLASS_SCALED, CLASS_IS_FOOD
+    names = getattr(model, "names", None) or {}
+    size = max(names.keys()) + 1 if names else 0
+
+    labels = [""] * size
+    nutrients = np.full((size, len(NUTRIENT_KEYS)), np.nan)
+    scaled = np.zeros(size, dtype=bool)
+    is_food = np.ones(size, dtype=bool)
+    for class_id, class_name in names.items():
+        labels[class_id] = class_name.title()
+        base = FOOD_DATABASE.get(class_name.lower().strip())
+        if base is None:
+            # resolved lazily by resolve_class_rows on first detection
+            continue
+        nutrients[class_id] = [base[k] for k in NUTRIENT_KEYS]
+        scaled[class_id] = True
+        is_food[class_id] = base.get("calories", 0) != 0
+
+    CLASS_LABELS, CLASS_NUTRIENTS, CLASS_SCALED, CLASS_IS_FOOD = labels, nutrients, scaled, is_food
+
+
+def resolve_class_rows(class_ids):
+    """Fill in lookup rows for detected classes missing from the local DB.
+
+    All unresolved classes are looked up concurrently within one request budget.
+    """
+    unresolved = [c for c in np.unique(class_ids).tolist() if np.isnan(CLASS_NUTRIENTS[c, 0])]
+    if not unresolved:
+        return
+    names = {c: model.names[c].lower().strip() for c in unresolved}
+    found = macro_providers.lookup_many(set(names.values()), macro_providers.new_deadline())
+    for class_id, name in names.items():
+        macros = found.get(name)
+        if macros is None:
+            # not cached so a later request can retry the remote lookup
+            continue
+        CLASS_NUTRIENTS[class_id] = [float(macros.get(k, 0)) for k in NUTRIENT_KEYS]
+
+
+def summarize_detections(boxes, image_area):
+    """Estimate portions and macros for all detected boxes in a single vectorized pass."""
+    class_ids = boxes.cls.cpu().numpy().astype(int)
+    confidences = boxes.conf.cpu().numpy()
+    xyxy = boxes.xyxy.cpu().numpy()
+
+    keep = CLASS_IS_FOOD[class_ids]
+    class_ids, confidences, xyxy = class_ids[keep], confidences[keep], xyxy[keep]
+    if len(class_ids) == 0:
+        return [], [0] * len(NUTRIENT_KEYS)
+
+    resolve_class_rows(class_ids)
+
+    # Estimate portion size from box area relative to the image
+    box_areas = (xyxy[:, 2] - xyxy[:, 0]) * (xyxy[:, 3] - xyxy[:, 1])
+    grams = np.clip((box_areas / image_area * 500).astype(int), 50, 300)
+
+    rows = CLASS_NUTRIENTS[class_ids]
+    fallback = np.isnan(rows[:, 0])
+    rows[fallback] = [FOOD_DATABASE["default_food"][k] for k in NUTRIENT_KEYS]
+    multiplier = np.where(CLASS_SCALED[class_ids], grams / 100, 1.0)
+    values = rows * multiplier[:, None]
+
+    # Python round() on the scaled values keeps results identical to get_food_macros
+    items = []
+    totals = [0] * len(NUTRIENT_KEYS)
+    for class_id, g, v, c in zip(class_ids.tolist(), grams.tolist(), values.tolist(), confidences.tolist()):
+        rounded = [round(v[0])] + [round(x, 1) for x in v[1:]]
+        items.append({
+            "name": CLASS_LABELS[class_id],
+            "grams": g,
+            **dict(zip(NUTRIENT_KEYS, rounded)),
+            "confidence": round(c * 100),
+        })
+        totals = [t + x for t, x in zip(totals, rounded)]
+    return items, totals
+
 
 # Load cache at startup to enrich the DB
 load_usda_cache_into_db()
@@ -131,20 +229,9 @@ def get_food_macros(class_name, estimated_grams=100):
     if macros and macros.get("calories", 0) == 0:
         return None
 
-    # 3️⃣ Try USDA if not in local
+    # 3️⃣ Try remote providers if not in local
     if macros is None:
-        usda_hits = usda_search(clean_name)
-        if usda_hits:
-            fdc_id = usda_hits[0]["id"]
-            usda_mac = usda_macros(fdc_id)
-            if usda_mac:
-                macros = usda_mac
-
-    # 4️⃣ Try Nutritionix if still None (disabled by default)
-    # if macros is None:
-    #     nx_mac = nutritionix_macros(clean_name, estimated_grams)
-    #     if nx_mac:
-    #         macros = nx_mac
+        macros = remote_food_macros(clean_name)
 
     # 5️⃣ Fallback to default if nothing found
     if macros is None:
@@ -176,28 +263,267 @@ def get_food_macros(class_name, estimated_grams=100):
 
     # (function ends above; no further processing required)
 
+
+# --- Upload Storage ---
+UPLOAD_DIR = "uploads"
+UPLOAD_QUEUE_SIZE = int(os.getenv("UPLOAD_QUEUE_SIZE", "64"))
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(500 * 1024 * 1024)))  # 0 disables the cap
+UPLOAD_MAX_AGE_DAYS = float(os.getenv("UPLOAD_MAX_AGE_DAYS", "30"))  # 0 keeps files forever
+UPLOAD_JPEG_QUALITY = int(os.getenv("UPLOAD_JPEG_QUALITY", "0"))  # >0 re-encodes uploads as JPEG
+
+
+class UploadStore:
+    """Content-addressed upload storage persisted by a background writer thread."""
+
+    def __init__(self, root=UPLOAD_DIR, max_bytes=UPLOAD_MAX_BYTES, max_age_days=UPLOAD_MAX_AGE_DAYS,
+                 jpeg_quality=UPLOAD_JPEG_QUALITY, queue_size=UPLOAD_QUEUE_SIZE):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age = max_age_days * 86400
+        self.jpeg_quality = jpeg_quality
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._index = None  # path -> (size, mtime), loaded lazily by the writer
+        self._total = 0
+        self._worker = threading.Thread(target=self._run, name="upload-store", daemon=True)
+        self._worker.start()
+
+    def path_for(self, contents: bytes, filename: Optional[str]) -> str:
+        digest = hashlib.sha256(contents).hexdigest()
+        if self.jpeg_quality > 0:
+            ext = ".jpg"
+        else:
+            ext = (os.path.splitext(filename)[1] if filename else "").lower() or ".jpg"
+        return os.path.join(self.root, f"{digest}{ext}")
+
+    def save(self, contents: bytes, filename: Optional[str] = None, image=None) -> Optional[str]:
+        """Queue an upload for persistence and return its path without touching the disk.
+
+        Returns None when the writer queue is full and the upload will not be stored.
+
+        When re-encoding is enabled, ``image`` (the already decoded, full-resolution
+        upload) is encoded directly instead of decoding ``contents`` a second time.
+        """
+        path = self.path_for(contents, filename)
+        if self.jpeg_quality <= 0:
+            image = None  # only needed for re-encoding; don't hold decoded pixels in the queue
+        with self._lock:
+            if path in self._pending:
+                return path
+            try:
+                self._queue.put_nowait((path, contents, image))
+            except queue.Full:
+                print(f"Upload queue full, skipping persistence of {path}")
+                return None
+            self._pending.add(path)
+        return path
+
+    def _run(self):
+        os.makedirs(self.root, exist_ok=True)
+        self._load_index()
+        while True:
+            path, contents, image = self._queue.get()
+            try:
+                self._write(path, contents, image)
+                self._evict()
+            except Exception as e:
+                print(f"Error persisting upload {path}: {str(e)}")
+            finally:
+                with self._lock:
+                    self._pending.discard(path)
+                self._queue.task_done()
+
+    def _load_index(self):
+        self._index = {}
+        for fname in os.listdir(self.root):
+            p = os.path.join(self.root, fname)
+            if fname.endswith(".tmp"):
+                # partial write from a failed write or a crash
+                try:
+                    os.remove(p)
+                except OSError:
+                    pass
+                continue
+            try:
+                st = os.stat(p)
+            except OSError:
+                continue
+            self._index[p] = (st.st_size, st.st_mtime)
+        self._total = sum(size for size, _ in self._index.values())
+
+    def _write(self, path: str, contents: bytes, image=None):
+        now = time.time()
+        if path in self._index:
+            # duplicate photo: refresh its age instead of writing another copy
+            os.utime(path, (now, now))
+            self._index[path] = (self._index[path][0], now)
+            return
+
+        if self.jpeg_quality > 0:
+            if image is None:
+                image = Image.open(io.BytesIO(contents)).convert("RGB")
+            buf = io.BytesIO()
+            image.save(buf, "JPEG", quality=self.jpeg_quality, optimize=True)
+            contents = buf.getvalue()
+
+        tmp_path = path + ".tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(contents)
+            os.replace(tmp_path, path)
+        except Exception:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        self._index[path] = (len(contents), now)
+        self._total += len(contents)
+
+    def _evict(self):
+        now = time.time()
+        expired = [p for p, (_, mtime) in self._index.items() if self.max_age and now - mtime > self.max_age]
+        over_cap = self.max_bytes and self._total > self.max_bytes
+        if not expired and not over_cap:
+            return
+
+        for p in expired:
+            self._remove(p)
+        if self.max_bytes and self._total > self.max_bytes:
+            # oldest first until back under the cap
+            for p, _ in sorted(self._index.items(), key=lambda item: item[1][1]):
+                if self._total <= self.max_bytes:
+                    break
+                self._remove(p)
+
+    def _remove(self, path: str):
+        size, _ = self._index.pop(path)
+        self._total -= size
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+upload_store = UploadStore()
+
+
+# --- Upload Ingestion ---
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", str(15 * 1024 * 1024)))
+MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", str(50_000_000)))
+UPLOAD_CHUNK_SIZE = 64 * 1024
+MULTIPART_OVERHEAD = 64 * 1024  # allowance for form boundaries and part headers
+DECODE_SIZE = (640, 640)  # YOLO input size; JPEGs are draft-decoded down towards this
+
+IMAGE_SIGNATURES = (
+    b"\xff\xd8\xff",         # JPEG
+    b"\x89PNG\r\n\x1a\n",  # PNG
+    b"GIF87a",
+    b"GIF89a",
+    b"BM",                    # BMP
+)
+
+
+class UploadSizeLimitMiddleware:
+    """Cap request bodies on upload routes before the multipart parser spools them.
+
+    Oversized requests are rejected on Content-Length up front, and the bytes pulled
+    from ``receive`` are counted so chunked bodies are cut off at the same limit.
+    """
+
+    def __init__(self, app, paths, max_body_size):
+        self.app = app
+        self.paths = set(paths)
+        self.max_body_size = max_body_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        content_length = dict(scope["headers"]).get(b"content-length")
+        too_large = content_length is not None and int(content_length) > self.max_body_size
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            # raised from inside request parsing so FastAPI turns it into a normal 413 response
+            if too_large:
+                raise HTTPException(status_code=413, detail="Image is too large")
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_size:
+                    raise HTTPException(status_code=413, detail="Image is too large")
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    paths=["/predict-calories"],
+    max_body_size=MAX_UPLOAD_SIZE + MULTIPART_OVERHEAD,
+)
+
+
+def is_supported_image(header: bytes) -> bool:
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return True
+    return header.startswith(IMAGE_SIGNATURES)
+
+
+async def read_upload(file: UploadFile) -> bytes:
+    """Read the (already size-capped) upload, rejecting oversized or non-image payloads."""
+    if file.size is not None and file.size > MAX_UPLOAD_SIZE:
+        raise HTTPException(status_code=413, detail="Image is too large")
+
+    chunks = []
+    received = 0
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        if not chunks and not is_supported_image(chunk):
+            raise HTTPException(status_code=415, detail="Unsupported image format")
+        received += len(chunk)
+        if received > MAX_UPLOAD_SIZE:
+            raise HTTPException(status_code=413, detail="Image is too large")
+        chunks.append(chunk)
+
+    if not chunks:
+        raise HTTPException(status_code=400, detail="Empty upload")
+    return b"".join(chunks)
+
+
+def decode_upload(contents: bytes):
+    """Decode an upload once, at reduced scale for JPEGs, into an RGB image.
+
+    Returns the image and whether it was draft-decoded below its full resolution.
+    """
+    # BytesIO over bytes shares the buffer instead of copying it
+    image = Image.open(io.BytesIO(contents))
+    width, height = image.size
+    if width * height > MAX_IMAGE_PIXELS:
+        raise HTTPException(status_code=413, detail="Image dimensions are too large")
+
+    if image.format == "JPEG":
+        # let libjpeg decode at 1/2, 1/4 or 1/8 scale while staying >= DECODE_SIZE
+        image.draft("RGB", DECODE_SIZE)
+    return image.convert("RGB"), image.size != (width, height)
+
 @app.get("/")
 def root():
     return {"message": "BiteWise Backend is running 🚀"}
  
 @app.post("/predict-calories")
 async def predict_calories(file: UploadFile = File(...)):
+    contents = await read_upload(file)
     try:
-        # Save uploaded file
-        file_id = str(uuid.uuid4())
-        file_extension = os.path.splitext(file.filename)[1] if file.filename else ".jpg"
-        file_path = f"uploads/{file_id}_{file.filename}"
-
-        # Create uploads directory if it doesn't exist
-        os.makedirs("uploads", exist_ok=True)
-
-        # Save the file
-        contents = await file.read()
-        with open(file_path, "wb") as f:
-            f.write(contents)
-
-        # Load image for YOLO
-        image = Image.open(io.BytesIO(contents)).convert("RGB")
+        # Decode once for YOLO; a full-resolution decode is shared with background persistence
+        image, drafted = decode_upload(contents)
+        file_path = upload_store.save(contents, file.filename, None if drafted else image)
 
         # YOLO prediction
         results = model.predict(image, conf=0.3)  # 30% confidence threshold
@@ -211,34 +537,11 @@ async def predict_calories(file: UploadFile = File(...)):
         total_fiber = 0
 
         if len(results) > 0 and len(results[0].boxes) > 0:
-            boxes = results[0].boxes
-            for box in boxes:
-                # Get class ID and confidence
-                class_id = int(box.cls[0])
-                confidence = float(box.conf[0])
-
-                # Get class name from model
-                class_name = model.names[class_id]
-
-                # Estimate portion size
-                x1, y1, x2, y2 = box.xyxy[0].tolist()
-                box_area = (x2 - x1) * (y2 - y1)
-                image_area = image.width * image.height
-                area_ratio = box_area / image_area
-                estimated_grams = max(50, min(300, int(area_ratio * 500)))
-
-                # Get nutritional information
-                food_info = get_food_macros(class_name, estimated_grams)
-                if food_info:
-                    food_info["confidence"] = round(confidence * 100)
-                    detected_foods.append(food_info)
-
-                    # Add to totals
-                    total_calories += food_info["calories"]
-                    total_protein += food_info["protein"]
-                    total_carbs += food_info["carbs"]
-                    total_fat += food_info["fat"]
-                    total_fiber += food_info["fiber"]
+            # remote macro lookups may block, so keep them off the event loop
+            detected_foods, totals = await run_in_threadpool(
+                summarize_detections, results[0].boxes, image.width * image.height
+            )
+            total_calories, total_protein, total_carbs, total_fat, total_fiber = totals
 
         # If no food detected, return default food item
         if not detected_foods:
@@ -288,6 +591,8 @@ async def predict_calories(file: UploadFile = File(...)):
     "filePath": file_path,
 }
 
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error processing image: {str(e)}")
         return {
@@ -570,10 +875,18 @@ def write_cache(name: str, data: dict) -> None:
         pass
 
 
-def usda_search(query: str) -> List[Dict[str, Any]]:
+def usda_search_cache_key(query: str) -> str:
+    return f"search_{query.lower().strip().replace(' ', '_')}.json"
+
+
+def usda_detail_cache_key(fdc_id: str) -> str:
+    return f"detail_{fdc_id}.json"
+
+
+def usda_search(query: str, timeout: float = 12) -> List[Dict[str, Any]]:
     if not USDA_API_KEY:
         return []
-    cache_key = f"search_{query.lower().strip().replace(' ', '_')}.json"
+    cache_key = usda_search_cache_key(query)
     cached = read_cache(cache_key)
     if cached:
         return cached.get("results", [])
@@ -586,7 +899,7 @@ def usda_search(query: str) -> List[Dict[str, Any]]:
         "sortBy": "score",
     }
     try:
-        resp = requests.get(USDA_SEARCH_URL, params=params, timeout=12)
+        resp = requests.get(USDA_SEARCH_URL, params=params, timeout=timeout)
         if resp.ok:
             data = resp.json()
             foods = data.get("foods", [])
@@ -605,16 +918,16 @@ def usda_search(query: str) -> List[Dict[str, Any]]:
     return []
 
 
-def usda_macros(fdc_id: str) -> Optional[Dict[str, float]]:
+def usda_macros(fdc_id: str, timeout: float = 12) -> Optional[Dict[str, float]]:
     if not USDA_API_KEY:
         return None
-    cache_key = f"detail_{fdc_id}.json"
+    cache_key = usda_detail_cache_key(fdc_id)
     cached = read_cache(cache_key)
     if cached:
         return cached.get("macros")
 
     try:
-        resp = requests.get(USDA_DETAILS_URL.format(fdc_id), params={"api_key": USDA_API_KEY}, timeout=12)
+        resp = requests.get(USDA_DETAILS_URL.format(fdc_id), params={"api_key": USDA_API_KEY}, timeout=timeout)
         if not resp.ok:
             return None
         data = resp.json()
@@ -640,6 +953,205 @@ def usda_macros(fdc_id: str) -> Optional[Dict[str, float]]:
         return macros
     except Exception:
         return None
+
+
+# --- Nutritionix Integration ---
+NUTRITIONIX_APP_ID = os.getenv("NUTRITIONIX_APP_ID")
+NUTRITIONIX_APP_KEY = os.getenv("NUTRITIONIX_APP_KEY")
+NUTRITIONIX_URL = "https://trackapi.nutritionix.com/v2/natural/nutrients"
+
+
+def nutritionix_macros(query: str, grams: int = 100, timeout: float = 12) -> Optional[Dict[str, float]]:
+    if not (NUTRITIONIX_APP_ID and NUTRITIONIX_APP_KEY):
+        return None
+    headers = {
+        "x-app-id": NUTRITIONIX_APP_ID,
+        "x-app-key": NUTRITIONIX_APP_KEY,
+        "Content-Type": "application/json",
+    }
+    try:
+        resp = requests.post(NUTRITIONIX_URL, json={"query": f"{grams}g {query}"}, headers=headers, timeout=timeout)
+        if not resp.ok:
+            return None
+        foods = resp.json().get("foods") or []
+        if not foods:
+            return None
+        item = foods[0]
+        return {
+            "calories": float(item.get("nf_calories") or 0),
+            "protein": float(item.get("nf_protein") or 0),
+            "carbs": float(item.get("nf_total_carbohydrate") or 0),
+            "fat": float(item.get("nf_total_fat") or 0),
+            "fiber": float(item.get("nf_dietary_fiber") or 0),
+        }
+    except Exception:
+        return None
+
+
+# --- Macro Provider Chain ---
+MACRO_LOOKUP_BUDGET_S = float(os.getenv("MACRO_LOOKUP_BUDGET_S", "3.0"))
+MACRO_HEDGE_DELAY_S = float(os.getenv("MACRO_HEDGE_DELAY_S", "0.5"))
+
+
+def time_left(deadline: float) -> float:
+    return max(0.0, deadline - time.monotonic())
+
+
+def offline_provider(query: str, deadline: float) -> Optional[Dict[str, float]]:
+    """Answer from the on-disk USDA cache only, never touching the network."""
+    cached = read_cache(usda_search_cache_key(query))
+    hits = (cached or {}).get("results") or []
+    if not hits:
+        return None
+    detail = read_cache(usda_detail_cache_key(hits[0]["id"]))
+    return (detail or {}).get("macros")
+
+
+def usda_provider(query: str, deadline: float) -> Optional[Dict[str, float]]:
+    usda_hits = usda_search(query, timeout=time_left(deadline))
+    if usda_hits and time_left(deadline) > 0:
+        return usda_macros(usda_hits[0]["id"], timeout=time_left(deadline))
+    return None
+
+
+def nutritionix_provider(query: str, deadline: float) -> Optional[Dict[str, float]]:
+    return nutritionix_macros(query, timeout=time_left(deadline))
+
+
+class MacroProvider:
+    """A named macro source plus the latency / win-rate stats collected for it."""
+
+    def __init__(self, name, lookup, remote=True, enabled=lambda: True):
+        self.name = name
+        self.lookup = lookup
+        self.remote = remote  # remote providers run in the hedging pool; others inline
+        self.enabled = enabled
+        self.calls = 0
+        self.completed = 0
+        self.hits = 0
+        self.wins = 0
+        self.errors = 0
+        self.total_latency = 0.0
+        self._lock = threading.Lock()
+
+    def __call__(self, query: str, deadline: float) -> Optional[Dict[str, float]]:
+        if time_left(deadline) <= 0:
+            # queued behind other lookups until the budget ran out
+            return None
+        with self._lock:
+            self.calls += 1
+        started = time.monotonic()
+        try:
+            result = self.lookup(query, deadline)
+        except Exception:
+            result = None
+            with self._lock:
+                self.errors += 1
+        with self._lock:
+            self.completed += 1
+            self.total_latency += time.monotonic() - started
+            if result:
+                self.hits += 1
+        return result
+
+    def record_win(self):
+        with self._lock:
+            self.wins += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "name": self.name,
+                "calls": self.calls,
+                "hits": self.hits,
+                "wins": self.wins,
+                "errors": self.errors,
+                "avgLatencyMs": round(self.total_latency / self.completed * 1000, 1) if self.completed else None,
+                "winRate": round(self.wins / self.calls, 3) if self.calls else None,
+            }
+
+
+class ProviderChain:
+    """Query providers in priority order within a latency budget, hedging slow remote ones."""
+
+    def __init__(self, providers, budget=MACRO_LOOKUP_BUDGET_S, hedge_delay=MACRO_HEDGE_DELAY_S):
+        self.providers = providers
+        self.budget = budget
+        self.hedge_delay = hedge_delay
+        # provider calls time out with the request deadline, so abandoned ones free up quickly
+        self._pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="macro-provider")
+        self._lookups = ThreadPoolExecutor(max_workers=8, thread_name_prefix="macro-lookup")
+
+    def new_deadline(self) -> float:
+        return time.monotonic() + self.budget
+
+    def lookup(self, query: str, deadline: Optional[float] = None) -> Optional[Dict[str, float]]:
+        if deadline is None:
+            deadline = self.new_deadline()
+        active = [p for p in self.providers if p.enabled()]
+
+        for provider in active:
+            if not provider.remote:
+                result = provider(query, deadline)
+                if result:
+                    provider.record_win()
+                    return result
+
+        remaining_providers = [p for p in active if p.remote]
+        pending = {}
+        while remaining_providers or pending:
+            if remaining_providers and not pending:
+                provider = remaining_providers.pop(0)
+                pending[self._pool.submit(provider, query, deadline)] = provider
+
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            if remaining_providers:
+                timeout = min(timeout, self.hedge_delay)
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                provider = pending.pop(future)
+                result = future.result()
+                if result:
+                    provider.record_win()
+                    return result
+            if not done and remaining_providers:
+                # hedge: the current providers are slow, start the next one alongside them
+                provider = remaining_providers.pop(0)
+                pending[self._pool.submit(provider, query, deadline)] = provider
+        return None
+
+    def lookup_many(self, queries, deadline: float) -> Dict[str, Optional[Dict[str, float]]]:
+        """Resolve several queries concurrently against one shared deadline."""
+        futures = {q: self._lookups.submit(self.lookup, q, deadline) for q in queries}
+        wait(futures.values(), timeout=time_left(deadline) + self.hedge_delay)
+        return {q: f.result() if f.done() else None for q, f in futures.items()}
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [p.stats() for p in self.providers]
+
+
+# FOOD_DATABASE is checked by callers before the chain, since local hits are scaled differently
+macro_providers = ProviderChain([
+    MacroProvider("offline", offline_provider, remote=False),
+    MacroProvider("usda", usda_provider, enabled=lambda: bool(USDA_API_KEY)),
+    MacroProvider("nutritionix", nutritionix_provider,
+                  enabled=lambda: bool(NUTRITIONIX_APP_ID and NUTRITIONIX_APP_KEY)),
+])
+
+
+def remote_food_macros(clean_name, deadline=None):
+    """Look up macros for a food missing from the local DB; None when the budget runs out."""
+    return macro_providers.lookup(clean_name, deadline)
+
+
+@app.get("/foods/providers")
+def foods_providers():
+    return {"providers": macro_providers.stats()}
+
+
 class FoodSearchRequest(BaseModel):
     q: str
 @app.get("/foods/search")